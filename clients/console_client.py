@@ -4,7 +4,7 @@ Console client for Drug Safety Intelligence MCP Server
 Provides a command-line interface to test the three tools
 """
 
-import os
+import re
 import sys
 import asyncio
 import argparse
@@ -12,18 +12,14 @@ import logging
 from dotenv import load_dotenv
 
 # Add parent directories to path
-import sys
 from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root / 'src'))
 sys.path.insert(0, str(project_root))
 
-from src.fda_service import FDAService
-from src.cache_service import CacheService
-from src.reference_data import ReferenceDataLoader
-from src.ai_service import AIService
-from clients.shared.drug_operations import get_safety_profile, check_recalls, compare_drugs
+from clients.shared.drug_operations import get_safety_profile, check_recalls, compare_drugs, pad_drugs
 from clients.shared.query_parser import QueryParser
+from clients.shared.services import get_services
 
 # Load environment
 load_dotenv()
@@ -33,11 +29,42 @@ logging.basicConfig(level=logging.WARNING)  # Less verbose for console
 logger = logging.getLogger(__name__)
 
 # Initialize services
-reference_data = ReferenceDataLoader("data/drugs_reference.json")
-cache_service = CacheService("data/cache.db", ttl_hours=24)
-fda_service = FDAService(rate_limit_per_minute=60)
-openai_key = os.getenv("OPENAI_API_KEY")
-ai_service = AIService(openai_key) if openai_key else None
+reference_data, cache_service, fda_service, ai_service = get_services()
+
+# Example queries shown in help and parse-failure hints
+_EXAMPLES_TEXT = "\n".join(f"  • {ex}" for ex in QueryParser.get_example_queries()[:3])
+
+# REPL commands
+_EXIT_COMMANDS = frozenset({'quit', 'exit', 'q'})
+_COMMANDS = frozenset({'safety', 'recall', 'compare', 'ask'})
+
+# Markdown/HTML stripped by print_result: HTML tags first, then headers and bold in one pass
+_RE_HTML = re.compile(r'<[^>]+>')
+_RE_MARKDOWN = re.compile(r'###\s+(.+)|##\s+(.+)|\*\*(.+?)\*\*')
+_RE_H2 = re.compile(r'##\s+(.+)')
+_RE_BOLD = re.compile(r'\*\*(.+?)\*\*')
+
+
+def _strip_bold(text: str) -> str:
+    """Remove markdown bold markers"""
+    return _RE_BOLD.sub(r'\1', text)
+
+
+def _format_h2(text: str) -> str:
+    """Format a ## header for console display"""
+    return "\n" + _strip_bold(text) + "\n" + '-'*50
+
+
+def _strip_markdown(match: re.Match) -> str:
+    """Replace a single header/bold match for console display"""
+    h3, h2, bold = match.groups()
+    if h3 is not None:
+        # ## and bold still apply to the formatted ### header, as they did
+        # when each pattern was a separate pass
+        return _strip_bold(_RE_H2.sub(lambda m: _format_h2(m.group(1)), f"\n{h3}:"))
+    if h2 is not None:
+        return _format_h2(h2)
+    return bold
 
 
 def print_banner():
@@ -51,14 +78,8 @@ def print_banner():
 def print_result(result: str):
     """Print formatted result"""
     # Strip markdown for console display (basic)
-    import re
-    # Remove HTML tags
-    result = re.sub(r'<[^>]+>', '', result)
-    # Convert markdown headers to uppercase
-    result = re.sub(r'###\s+(.+)', r'\n\1:', result)
-    result = re.sub(r'##\s+(.+)', r'\n\1\n' + '-'*50, result)
-    # Remove markdown bold
-    result = re.sub(r'\*\*(.+?)\*\*', r'\1', result)
+    result = _RE_HTML.sub('', result)
+    result = _RE_MARKDOWN.sub(_strip_markdown, result)
     
     print("\n" + result + "\n")
 
@@ -79,9 +100,7 @@ async def handle_recall_query(drug_name: str):
 
 async def handle_compare_query(drugs: list):
     """Handle drug comparison query"""
-    drug1 = drugs[0] if len(drugs) > 0 else ""
-    drug2 = drugs[1] if len(drugs) > 1 else ""
-    drug3 = drugs[2] if len(drugs) > 2 else ""
+    drug1, drug2, drug3 = pad_drugs(drugs)
     
     print(f"\n🔄 Comparing {', '.join([d for d in drugs if d])}...")
     result = await compare_drugs(drug1, drug2, drug3, reference_data, fda_service, ai_service)
@@ -96,8 +115,7 @@ async def handle_natural_language_query(query: str):
     
     if intent == 'unknown' or not drugs:
         print("\n❌ I couldn't understand your query. Try questions like:")
-        for ex in QueryParser.get_example_queries()[:3]:
-            print(f"  • {ex}")
+        print(_EXAMPLES_TEXT)
         return
     
     print(f"📝 Detected: {intent.upper()} query for {', '.join(drugs)}")
@@ -112,6 +130,18 @@ async def handle_natural_language_query(query: str):
 
 def interactive_mode():
     """Run in interactive REPL mode"""
+    # One event loop for the whole session, so the FDA client and its keep-alive
+    # connections are reused across commands rather than left open per command
+    loop = asyncio.new_event_loop()
+    try:
+        _repl(loop)
+    finally:
+        loop.run_until_complete(fda_service.close())
+        loop.close()
+
+
+def _repl(loop: asyncio.AbstractEventLoop):
+    """Read and run commands on the session's event loop until the user quits"""
     print_banner()
     print("Interactive Mode - Type 'help' for commands, 'quit' to exit\n")
     
@@ -122,11 +152,13 @@ def interactive_mode():
             if not query:
                 continue
             
-            if query.lower() in ['quit', 'exit', 'q']:
+            folded = query.casefold()
+            
+            if folded in _EXIT_COMMANDS:
                 print("\n👋 Goodbye!\n")
                 break
             
-            if query.lower() == 'help':
+            if folded == 'help':
                 print("\nAvailable Commands:")
                 print("  • safety <drug>          - Get safety profile")
                 print("  • recall <drug>          - Check for recalls")
@@ -135,29 +167,29 @@ def interactive_mode():
                 print("  • help                   - Show this help")
                 print("  • quit                   - Exit")
                 print("\nOr just ask naturally:")
-                for ex in QueryParser.get_example_queries()[:3]:
-                    print(f"  • {ex}")
+                print(_EXAMPLES_TEXT)
                 print()
                 continue
             
             # Parse command
             parts = query.split(maxsplit=1)
-            command = parts[0].lower()
+            command = parts[0].casefold()
             
-            if command == 'safety' and len(parts) > 1:
-                asyncio.run(handle_safety_query(parts[1]))
-            elif command == 'recall' and len(parts) > 1:
-                asyncio.run(handle_recall_query(parts[1]))
-            elif command == 'compare' and len(parts) > 1:
-                drugs = [d.strip() for d in parts[1].split(',') if d.strip()]
-                if len(drugs) < 2:
-                    drugs = parts[1].split()
-                asyncio.run(handle_compare_query(drugs))
-            elif command == 'ask' and len(parts) > 1:
-                asyncio.run(handle_natural_language_query(parts[1]))
+            if len(parts) > 1 and command in _COMMANDS:
+                if command == 'safety':
+                    loop.run_until_complete(handle_safety_query(parts[1]))
+                elif command == 'recall':
+                    loop.run_until_complete(handle_recall_query(parts[1]))
+                elif command == 'compare':
+                    drugs = [d.strip() for d in parts[1].split(',') if d.strip()]
+                    if len(drugs) < 2:
+                        drugs = parts[1].split()
+                    loop.run_until_complete(handle_compare_query(drugs))
+                else:
+                    loop.run_until_complete(handle_natural_language_query(parts[1]))
             else:
                 # Try as natural language query
-                asyncio.run(handle_natural_language_query(query))
+                loop.run_until_complete(handle_natural_language_query(query))
         
         except KeyboardInterrupt:
             print("\n\n👋 Goodbye!\n")
@@ -4,9 +4,7 @@ Gradio client for Drug Safety Intelligence MCP Server
 Provides a web interface to test the three tools
 """
 
-import os
 import sys
-import asyncio
 import json
 import logging
 from dotenv import load_dotenv
@@ -14,19 +12,15 @@ from dotenv import load_dotenv
 import gradio as gr
 
 # Add parent directories to path
-import sys
 from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root / 'src'))
 sys.path.insert(0, str(project_root))
 
-from src.fda_service import FDAService
-from src.cache_service import CacheService
-from src.reference_data import ReferenceDataLoader
-from src.ai_service import AIService
 from src.models import SafetyProfile, RecallInfo, DrugComparison, DrugComparisonItem
-from clients.shared.drug_operations import get_safety_profile, check_recalls, compare_drugs
+from clients.shared.drug_operations import stream_safety_profile, check_recalls, compare_drugs, pad_drugs
 from clients.shared.query_parser import QueryParser
+from clients.shared.services import get_services
 
 # Load environment
 load_dotenv()
@@ -36,39 +30,40 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Initialize services
-reference_data = ReferenceDataLoader("data/drugs_reference.json")
-cache_service = CacheService("data/cache.db", ttl_hours=24)
-fda_service = FDAService(rate_limit_per_minute=60)
-openai_key = os.getenv("OPENAI_API_KEY")
-ai_service = AIService(openai_key) if openai_key else None
+reference_data, cache_service, fda_service, ai_service = get_services()
+
+# Example queries, built once for the UI and parse-failure hints
+_EXAMPLES = QueryParser.get_example_queries()
+_EXAMPLES_MD = "\n".join(f"• {ex}" for ex in _EXAMPLES[:3])
 
 
-# Wrap async functions for Gradio with progress tracking
-def get_safety_profile_wrapper(drug_name: str, progress=gr.Progress()) -> str:
+# Async handlers for Gradio with progress tracking
+async def get_safety_profile_wrapper(drug_name: str, progress=gr.Progress()):
     progress(0, desc="🔄 Fetching safety data...")
-    result = asyncio.run(get_safety_profile(drug_name, reference_data, fda_service, ai_service))
+    async for partial in stream_safety_profile(drug_name, reference_data, fda_service, ai_service):
+        yield partial
     progress(1, desc="✅ Complete!")
-    return result
 
 
-def check_recalls_wrapper(drug_name: str, progress=gr.Progress()) -> str:
+async def check_recalls_wrapper(drug_name: str, progress=gr.Progress()) -> str:
     progress(0, desc="🔄 Checking FDA recalls...")
-    result = asyncio.run(check_recalls(drug_name, reference_data, fda_service))
+    result = await check_recalls(drug_name, reference_data, fda_service)
     progress(1, desc="✅ Complete!")
     return result
 
 
-def compare_drugs_wrapper(drug1: str, drug2: str, drug3: str = "", progress=gr.Progress()) -> str:
+async def compare_drugs_wrapper(drug1: str, drug2: str, drug3: str = "", progress=gr.Progress()) -> str:
     progress(0, desc="🔄 Comparing drugs...")
-    result = asyncio.run(compare_drugs(drug1, drug2, drug3, reference_data, fda_service, ai_service))
+    result = await compare_drugs(drug1, drug2, drug3, reference_data, fda_service, ai_service)
     progress(1, desc="✅ Complete!")
     return result
 
 
-def natural_language_query_wrapper(query: str, progress=gr.Progress()) -> str:
-    """Handle natural language queries"""
+async def natural_language_query_wrapper(query: str, progress=gr.Progress()):
+    """Handle natural language queries, streaming safety profiles as they build"""
     if not query.strip():
-        return "❌ Please enter a query"
+        yield "❌ Please enter a query"
+        return
     
     progress(0, desc="🔄 Understanding your query...")
     
@@ -78,26 +73,24 @@ def natural_language_query_wrapper(query: str, progress=gr.Progress()) -> str:
     logger.info(f"Query: '{query}' | Intent: {intent} | Drugs: {drugs}")
     
     if intent == 'unknown' or not drugs:
-        examples = "\n".join([f"• {ex}" for ex in QueryParser.get_example_queries()[:3]])
-        return f"❌ I couldn't understand your query. Try questions like:\n\n{examples}"
+        yield f"❌ I couldn't understand your query. Try questions like:\n\n{_EXAMPLES_MD}"
+        return
     
     progress(0.3, desc=f"🔄 Processing {intent} query...")
     
     # Route to appropriate handler
     if intent == 'safety':
-        result = asyncio.run(get_safety_profile(drugs[0], reference_data, fda_service, ai_service))
+        async for result in stream_safety_profile(drugs[0], reference_data, fda_service, ai_service):
+            yield result
     elif intent == 'recall':
-        result = asyncio.run(check_recalls(drugs[0], reference_data, fda_service))
+        yield await check_recalls(drugs[0], reference_data, fda_service)
     elif intent == 'compare':
-        drug1 = drugs[0] if len(drugs) > 0 else ""
-        drug2 = drugs[1] if len(drugs) > 1 else ""
-        drug3 = drugs[2] if len(drugs) > 2 else ""
-        result = asyncio.run(compare_drugs(drug1, drug2, drug3, reference_data, fda_service, ai_service))
+        drug1, drug2, drug3 = pad_drugs(drugs)
+        yield await compare_drugs(drug1, drug2, drug3, reference_data, fda_service, ai_service)
     else:
-        result = "❌ Unable to process query"
+        yield "❌ Unable to process query"
     
     progress(1, desc="✅ Complete!")
-    return result
 
 
 # Create Gradio interface
@@ -111,8 +104,7 @@ with gr.Blocks(title="Drug Safety Intelligence") as demo:
             gr.Markdown("### Ask questions in plain English about drug safety")
             gr.Markdown("**Examples:**")
             
-            example_queries = QueryParser.get_example_queries()
-            examples_md = "\n".join([f"• *{ex}*" for ex in example_queries])
+            examples_md = "\n".join([f"• *{ex}*" for ex in _EXAMPLES])
             gr.Markdown(examples_md)
             
             with gr.Row():
@@ -218,4 +210,5 @@ with gr.Blocks(title="Drug Safety Intelligence") as demo:
 
 
 if __name__ == "__main__":
+    demo.queue(default_concurrency_limit=8)
     demo.launch(share=False, show_error=True)
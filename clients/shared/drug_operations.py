@@ -4,45 +4,248 @@ Drug safety operations
 Contains the core business logic for drug safety queries
 """
 
+import asyncio
+import functools
 import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from itertools import islice
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
+# Shared read-only stand-in for missing FDA event sections
+_EMPTY = {}
 
-async def get_safety_profile(drug_name: str, reference_data, fda_service, ai_service=None) -> str:
-    """Get comprehensive safety profile for a drug"""
+# In-process cache of FDA responses, keyed by (operation, lowercased fda_name)
+_FETCH_CACHE_MAXSIZE = 512
+_FETCH_CACHE_TTL_SECONDS = 24 * 3600
+_fetch_cache = OrderedDict()
+_fetch_cache_lock = threading.Lock()
+
+
+def _fetch_cache_get(key: tuple):
+    """Get a cached FDA response, or None if missing or expired"""
+    with _fetch_cache_lock:
+        entry = _fetch_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del _fetch_cache[key]
+            return None
+        _fetch_cache.move_to_end(key)
+        return value
+
+
+def _fetch_cache_set(key: tuple, value) -> None:
+    """Cache an FDA response, evicting the least recently used entries"""
+    if value is None:
+        return
+    with _fetch_cache_lock:
+        _fetch_cache[key] = (time.monotonic() + _FETCH_CACHE_TTL_SECONDS, value)
+        _fetch_cache.move_to_end(key)
+        while len(_fetch_cache) > _FETCH_CACHE_MAXSIZE:
+            _fetch_cache.popitem(last=False)
+
+
+# In-flight FDA fetches, so concurrent callers for the same key share one request
+_inflight = {}
+
+
+async def _fetch_and_cache(key: tuple, coro):
+    """Await an FDA fetch and cache its result before it leaves the in-flight registry"""
+    value = await coro
+    _fetch_cache_set(key, value)
+    return value
+
+
+def _start_fetch(key: tuple, coro) -> asyncio.Future:
+    """Register an FDA fetch as in flight until it completes"""
+    task = asyncio.ensure_future(_fetch_and_cache(key, coro))
+    _inflight[key] = task
+    task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return task
+
+
+async def _cached_fetch(key: tuple, fetch):
+    """Serve from the in-process cache, joining an in-flight fetch on a miss"""
+    value = _fetch_cache_get(key)
+    if value is not None:
+        return value
+    
+    task = _inflight.get(key) or _start_fetch(key, fetch())
+    # Shield so a cancelled caller doesn't cancel the fetch other callers are awaiting
+    return await asyncio.shield(task)
+
+
+async def _cached_adverse_events(fda_service, fda_name: str):
+    """Get adverse events, serving repeats from the in-process cache"""
+    key = ("adverse_events", fda_name.lower())
+    return await _cached_fetch(key, lambda: fda_service.get_adverse_events(fda_name))
+
+
+async def _cached_recalls(fda_service, fda_name: str):
+    """Get recalls, serving repeats from the in-process cache"""
+    key = ("recalls", fda_name.lower())
+    return await _cached_fetch(key, lambda: fda_service.get_recalls(fda_name))
+
+
+@functools.lru_cache(maxsize=1024)
+def _lookup_fda_name(reference_data, drug_name_lower: str):
+    """Memoized reference data lookup of the FDA generic name"""
+    if reference_data.is_valid_drug(drug_name_lower):
+        return reference_data.get_fda_generic_name(drug_name_lower)
+    return None
+
+
+def _resolve_fda_name(drug_name: str, reference_data) -> str:
+    """Get FDA generic name from reference data, otherwise use provided name"""
+    fda_name = _lookup_fda_name(reference_data, drug_name.strip().lower())
+    
+    # If not in reference data or no FDA name found, try the provided name directly
+    if not fda_name:
+        logger.info(f"Drug '{drug_name}' not in reference database, trying FDA API directly")
+        fda_name = drug_name
+    return fda_name
+
+
+def _precheck_drug_name(drug_name: str, reference_data) -> Optional[str]:
+    """Return an error message for names that can be rejected without calling FDA"""
+    name = drug_name.strip()
+    if len(name) < 2:
+        return "❌ Please provide a drug name (at least 2 characters)."
+    
+    # Unknown name that closely matches reference drugs: suggest instead of querying FDA
+    if _lookup_fda_name(reference_data, name.lower()) is None:
+        similar = reference_data.search_drugs(name)
+        if similar:
+            return f"❌ '{name}' not found in reference database. Did you mean: {', '.join([d.name for d in similar[:5]])}?"
+    return None
+
+
+def _top_reactions(events: list, k: int) -> list:
+    """Get the k most reported reactions across the first 50 adverse events"""
+    counter = Counter()
+    for event in islice(events or (), 50):
+        patient = event.get("patient") or _EMPTY
+        counter.update(
+            reaction.get("reactionmeddrapt", "Unknown")
+            for reaction in patient.get("reaction") or ()
+        )
+    return [effect for effect, _ in counter.most_common(k)]
+
+
+def pad_drugs(drugs: list) -> list:
+    """Pad or trim a drug list to the three compare_drugs slots"""
+    return (list(drugs) + ["", "", ""])[:3]
+
+
+def _render_safety_profile(drug_name: str, summary: Optional[str], events_count: int, recall_count: int, top_side_effects: list) -> str:
+    """Format a safety profile as markdown; a summary of None renders a placeholder"""
+    # Format output with improved styling
+    parts = [f"## 💊 Safety Profile: {drug_name}\n\n"]
+    
+    # Show AI Analysis first (most important insight)
+    if summary is None:
+        parts.append("### 🤖 AI Analysis\n\n*Generating summary...*\n\n")
+    elif summary:
+        parts.append(f"### 🤖 AI Analysis\n\n{summary}\n\n")
+    
+    parts.append("---\n\n")
+    
+    # Display tables side by side using HTML
+    parts.append("<div style='display: flex; gap: 20px; flex-wrap: wrap;'>\n")
+    parts.append("<div style='flex: 1; min-width: 300px;'>\n\n")
+    
+    # Display key metrics in a table
+    parts.append("### 📊 Key Safety Metrics\n\n")
+    parts.append("| Metric | Count | Status |\n")
+    parts.append("|--------|------:|--------|\n")
+    parts.append(f"| **Adverse Event Reports** | {events_count:,} | ")
+    parts.append("🟢 Low" if events_count < 1000 else "🟡 Moderate" if events_count < 10000 else "🔴 High")
+    parts.append(" |\n")
+    parts.append(f"| **Active Recalls** | {recall_count} | ")
+    parts.append("✅ None" if recall_count == 0 else f"⚠️ {recall_count} Active")
+    parts.append(" |\n\n")
+    
+    parts.append("</div>\n")
+    parts.append("<div style='flex: 1; min-width: 300px;'>\n\n")
+    
+    # Side effects section
+    parts.append("### ⚕️ Common Side Effects\n\n")
+    if top_side_effects:
+        parts.append("| # | Side Effect |\n")
+        parts.append("|---|-------------|\n")
+        for i, effect in enumerate(top_side_effects, 1):
+            parts.append(f"| {i} | {effect} |\n")
+    else:
+        parts.append("No significant side effects data available\n")
+    
+    parts.append("\n</div>\n")
+    parts.append("</div>\n\n")
+    
+    parts.append("---\n\n")
+    parts.append("> ⚠️ *This information is for educational purposes only. Always consult your healthcare provider.*")
+    
+    return "".join(parts)
+
+
+async def stream_safety_profile(drug_name: str, reference_data, fda_service, ai_service=None):
+    """
+    Stream a safety profile for a drug
+    
+    Yields the FDA metrics as soon as they arrive, then the complete profile
+    once the AI summary is ready.
+    """
     try:
         logger.info(f"Fetching safety profile for {drug_name}")
         
-        # Try to get FDA generic name from reference data, otherwise use provided name
-        fda_name = None
-        if reference_data.is_valid_drug(drug_name):
-            fda_name = reference_data.get_fda_generic_name(drug_name)
-        
-        # If not in reference data or no FDA name found, try the provided name directly
-        if not fda_name:
-            logger.info(f"Drug not in reference database, trying FDA API directly with: {drug_name}")
-            fda_name = drug_name
-        
-        # Get adverse events and recalls
-        adverse_events = await fda_service.get_adverse_events(fda_name)
-        recalls = await fda_service.get_recalls(fda_name)
+        error = _precheck_drug_name(drug_name, reference_data)
+        if error:
+            yield error
+            return
+        
+        fda_name = _resolve_fda_name(drug_name, reference_data)
+        
+        # Get adverse events and recalls concurrently
+        adverse_events, recalls = await asyncio.gather(
+            _cached_adverse_events(fda_service, fda_name),
+            _cached_recalls(fda_service, fda_name),
+            return_exceptions=True
+        )
+        if isinstance(adverse_events, Exception):
+            logger.error(f"Failed to fetch adverse events: {adverse_events}")
+            adverse_events = None
+        if isinstance(recalls, Exception):
+            logger.error(f"Failed to fetch recalls: {recalls}")
+            recalls = None
         
         if not adverse_events:
             # Try to suggest similar drugs from reference database
             similar = reference_data.search_drugs(drug_name)
             if similar:
-                return f"❌ No FDA data found for '{drug_name}'. Did you mean: {', '.join([d.name for d in similar[:5]])}?"
-            return f"❌ No FDA data found for '{drug_name}'. Please check the spelling or try a generic drug name."
+                yield f"❌ No FDA data found for '{drug_name}'. Did you mean: {', '.join([d.name for d in similar[:5]])}?"
+                return
+            yield f"❌ No FDA data found for '{drug_name}'. Please check the spelling or try a generic drug name."
+            return
         
         events_count = adverse_events.get("total_count", 0)
         recall_count = recalls.get("total_count", 0) if recalls else 0
         
-        # Generate summary with AI if available
+        # Extract side effects from adverse events
+        top_side_effects = []
+        
+        if adverse_events.get("adverse_events"):
+            top_side_effects = _top_reactions(adverse_events["adverse_events"], 5)
+        
+        # Generate summary with AI if available, off the event loop, showing the FDA data while it runs
         summary = ""
         if ai_service and adverse_events:
+            yield _render_safety_profile(drug_name, None, events_count, recall_count, top_side_effects)
             try:
-                summary = ai_service.generate_safety_summary(drug_name, adverse_events)
+                summary = await asyncio.to_thread(ai_service.generate_safety_summary, drug_name, adverse_events)
                 logger.info(f"AI Summary Generated: {summary}")
             except Exception as e:
                 logger.error(f"Failed to generate AI summary: {e}")
@@ -51,67 +254,19 @@ async def get_safety_profile(drug_name: str, reference_data, fda_service, ai_ser
         if not summary:
             summary = f"{drug_name} has {events_count} reported adverse events. Consult healthcare provider for personalized advice."
         
-        # Extract side effects from adverse events
-        top_side_effects = []
-        
-        if adverse_events.get("adverse_events"):
-            side_effects = {}
-            for event in adverse_events["adverse_events"][:50]:
-                reactions = event.get("patient", {}).get("reaction", [])
-                for reaction in reactions:
-                    effect = reaction.get("reactionmeddrapt", "Unknown")
-                    side_effects[effect] = side_effects.get(effect, 0) + 1
-            
-            top_side_effects = [effect for effect, _ in sorted(side_effects.items(), key=lambda x: x[1], reverse=True)[:5]]
-        
-        # Format output with improved styling
-        result = f"## 💊 Safety Profile: {drug_name}\n\n"
-        
-        # Show AI Analysis first (most important insight)
-        if summary:
-            result += f"### 🤖 AI Analysis\n\n{summary}\n\n"
-        
-        result += "---\n\n"
-        
-        # Display tables side by side using HTML
-        result += "<div style='display: flex; gap: 20px; flex-wrap: wrap;'>\n"
-        result += "<div style='flex: 1; min-width: 300px;'>\n\n"
-        
-        # Display key metrics in a table
-        result += "### 📊 Key Safety Metrics\n\n"
-        result += "| Metric | Count | Status |\n"
-        result += "|--------|------:|--------|\n"
-        result += f"| **Adverse Event Reports** | {events_count:,} | "
-        result += "🟢 Low" if events_count < 1000 else "🟡 Moderate" if events_count < 10000 else "🔴 High"
-        result += " |\n"
-        result += f"| **Active Recalls** | {recall_count} | "
-        result += "✅ None" if recall_count == 0 else f"⚠️ {recall_count} Active"
-        result += " |\n\n"
-        
-        result += "</div>\n"
-        result += "<div style='flex: 1; min-width: 300px;'>\n\n"
-        
-        # Side effects section
-        result += "### ⚕️ Common Side Effects\n\n"
-        if top_side_effects:
-            result += "| # | Side Effect |\n"
-            result += "|---|-------------|\n"
-            for i, effect in enumerate(top_side_effects, 1):
-                result += f"| {i} | {effect} |\n"
-        else:
-            result += "No significant side effects data available\n"
-        
-        result += "\n</div>\n"
-        result += "</div>\n\n"
-        
-        result += "---\n\n"
-        result += "> ⚠️ *This information is for educational purposes only. Always consult your healthcare provider.*"
-        
-        return result
+        yield _render_safety_profile(drug_name, summary, events_count, recall_count, top_side_effects)
         
     except Exception as e:
         logger.error(f"Error fetching safety profile: {e}")
-        return f"❌ Error: {str(e)}"
+        yield f"❌ Error: {str(e)}"
+
+
+async def get_safety_profile(drug_name: str, reference_data, fda_service, ai_service=None) -> str:
+    """Get comprehensive safety profile for a drug"""
+    result = ""
+    async for result in stream_safety_profile(drug_name, reference_data, fda_service, ai_service):
+        pass
+    return result
 
 
 async def check_recalls(drug_name: str, reference_data, fda_service) -> str:
@@ -119,24 +274,20 @@ async def check_recalls(drug_name: str, reference_data, fda_service) -> str:
     try:
         logger.info(f"Checking recalls for {drug_name}")
         
-        # Try to get FDA generic name from reference data, otherwise use provided name
-        fda_name = None
-        if reference_data.is_valid_drug(drug_name):
-            fda_name = reference_data.get_fda_generic_name(drug_name)
+        error = _precheck_drug_name(drug_name, reference_data)
+        if error:
+            return error
         
-        # If not in reference data or no FDA name found, try the provided name directly
-        if not fda_name:
-            logger.info(f"Drug not in reference database, trying FDA API directly with: {drug_name}")
-            fda_name = drug_name
+        fda_name = _resolve_fda_name(drug_name, reference_data)
         
         # Get recalls
-        recalls = await fda_service.get_recalls(fda_name)
+        recalls = await _cached_recalls(fda_service, fda_name)
         
         if not recalls or recalls.get("total_count", 0) == 0:
             return f"## ✅ No Active Recalls\n\n**{drug_name}** has no active recalls reported.\n\n---\n\n> 🔍 *Data sourced from FDA public API*"
         
-        result = f"## 🚨 Active Recalls for {drug_name}\n\n"
-        result += "---\n\n"
+        parts = [f"## 🚨 Active Recalls for {drug_name}\n\n"]
+        parts.append("---\n\n")
         
         for i, recall in enumerate(recalls.get("recalls", [])[:10], 1):
             reason = recall.get("reason_for_recall", "Unknown reason")
@@ -146,15 +297,15 @@ async def check_recalls(drug_name: str, reference_data, fda_service) -> str:
             # Classification emoji
             class_emoji = "🔴" if classification == "Class I" else "🟡" if classification == "Class II" else "🟢"
             
-            result += f"### {class_emoji} Recall #{i}\n"
-            result += f"• **Reason:** {reason}\n"
-            result += f"• **Classification:** {classification}\n"
-            result += f"• **Date:** {recall_date}\n\n"
+            parts.append(f"### {class_emoji} Recall #{i}\n")
+            parts.append(f"• **Reason:** {reason}\n")
+            parts.append(f"• **Classification:** {classification}\n")
+            parts.append(f"• **Date:** {recall_date}\n\n")
         
-        result += "---\n\n"
-        result += "> ⚠️ *This information is for educational purposes only. Contact your healthcare provider if concerned.*"
+        parts.append("---\n\n")
+        parts.append("> ⚠️ *This information is for educational purposes only. Contact your healthcare provider if concerned.*")
         
-        return result
+        return "".join(parts)
         
     except Exception as e:
         logger.error(f"Error checking recalls: {e}")
@@ -171,26 +322,20 @@ async def compare_drugs(drug1: str, drug2: str, drug3: str, reference_data, fda_
         
         logger.info(f"Comparing drugs: {drugs_to_compare}")
         
-        result = f"## 🔬 Drug Safety Comparison\n\n"
-        result += "---\n\n"
+        parts = [f"## 🔬 Drug Safety Comparison\n\n"]
+        parts.append("---\n\n")
         
         drugs_data = []
-        comparison_text = ""
         
-        for drug in drugs_to_compare:
-            # Try to get FDA generic name from reference data, otherwise use provided name
-            fda_name = None
-            if reference_data.is_valid_drug(drug):
-                fda_name = reference_data.get_fda_generic_name(drug)
-            
-            # If not in reference data or no FDA name found, try the provided name directly
-            if not fda_name:
-                logger.info(f"Drug '{drug}' not in reference database, trying FDA API directly")
-                fda_name = drug
-            
-            # Get adverse events
-            adverse_events = await fda_service.get_adverse_events(fda_name)
-            
+        fda_names = [_resolve_fda_name(drug, reference_data) for drug in drugs_to_compare]
+        
+        # Get adverse events for all drugs concurrently, through the same cached lookup as
+        # the safety profile so both report the same totals
+        all_events = await asyncio.gather(
+            *(_cached_adverse_events(fda_service, fda_name) for fda_name in fda_names)
+        )
+        
+        for drug, adverse_events in zip(drugs_to_compare, all_events):
             if not adverse_events:
                 # Try to suggest similar drugs from reference database
                 similar = reference_data.search_drugs(drug)
@@ -203,19 +348,13 @@ async def compare_drugs(drug1: str, drug2: str, drug3: str, reference_data, fda_
             # Get top side effect
             top_effect = ""
             if adverse_events.get("adverse_events"):
-                side_effects = {}
-                for event in adverse_events["adverse_events"][:50]:
-                    reactions = event.get("patient", {}).get("reaction", [])
-                    for reaction in reactions:
-                        effect = reaction.get("reactionmeddrapt", "Unknown")
-                        side_effects[effect] = side_effects.get(effect, 0) + 1
-                
-                if side_effects:
-                    top_effect = max(side_effects.items(), key=lambda x: x[1])[0]
+                top_effects = _top_reactions(adverse_events["adverse_events"], 1)
+                if top_effects:
+                    top_effect = top_effects[0]
             
-            comparison_text += f"\n### 💊 {drug}\n"
-            comparison_text += f"• **Adverse Events:** {events_count:,} reports\n"
-            comparison_text += f"• **Primary Concern:** {top_effect if top_effect else 'N/A'}\n"
+            parts.append(f"\n### 💊 {drug}\n")
+            parts.append(f"• **Adverse Events:** {events_count:,} reports\n")
+            parts.append(f"• **Primary Concern:** {top_effect if top_effect else 'N/A'}\n")
             
             drugs_data.append({
                 "name": drug,
@@ -223,17 +362,15 @@ async def compare_drugs(drug1: str, drug2: str, drug3: str, reference_data, fda_
                 "concern": top_effect if top_effect else "N/A"
             })
         
-        result += comparison_text
-        
         # Get AI recommendation if available
         if ai_service and len(drugs_data) >= 2:
-            recommendation = ai_service.generate_comparison_recommendation(drugs_data)
-            result += f"\n---\n\n### 🤖 AI Recommendation\n{recommendation}\n"
+            recommendation = await asyncio.to_thread(ai_service.generate_comparison_recommendation, drugs_data)
+            parts.append(f"\n---\n\n### 🤖 AI Recommendation\n{recommendation}\n")
         
-        result += "\n---\n\n"
-        result += "> 📋 *Comparison based on FDA adverse event reports. Consult your healthcare provider for personalized advice.*"
+        parts.append("\n---\n\n")
+        parts.append("> 📋 *Comparison based on FDA adverse event reports. Consult your healthcare provider for personalized advice.*")
         
-        return result
+        return "".join(parts)
         
     except Exception as e:
         logger.error(f"Error comparing drugs: {e}")
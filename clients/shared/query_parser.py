@@ -4,11 +4,114 @@ Natural language query parser for drug safety queries
 """
 
 import re
+import string
+import functools
+import itertools
 import logging
 from typing import Tuple, List, Optional
 
 logger = logging.getLogger(__name__)
 
+# Intent patterns, compiled once per process. Patterns that open with (.+) are anchored
+# to the start of a line: whenever one matches, its leftmost match begins there, so the
+# engine can skip every other start position.
+_COMPARE_PATTERNS = [re.compile(p) for p in (
+    r'compare\s+(.+)',
+    r'comparison\s+(?:of\s+)?(.+)',
+    r'(?m:^)(.+)\s+vs\s+(.+)',
+    r'(?m:^)(.+)\s+versus\s+(.+)',
+)]
+
+_RECALL_PATTERNS = [re.compile(p) for p in (
+    r'(?:any\s+)?recalls?\s+(?:for|on|about)\s+(.+)',
+    r'(?:check|find)\s+recalls?\s+(?:for|on)?\s*(.+)',
+    r'is\s+(.+)\s+recalled',
+    r'has\s+(.+)\s+been\s+recalled',
+)]
+
+_SAFETY_PATTERNS = [re.compile(p) for p in (
+    r'(?:tell me about|what about|info on|information on)\s+(.+?)(?:\'s)?\s+safety',
+    r'(?:is|how)\s+safe\s+(?:is\s+)?(.+)',
+    r'safety\s+(?:of|profile|info|information)\s+(?:for|on|about)?\s*(.+)',
+    r'(?:side effects?|adverse events?)\s+(?:of|for)\s+(.+)',
+    r'(?m:^)(.+)\s+(?:side effects?|adverse events?|safety)',
+    r'(?:what|tell me)\s+(?:about|is)\s+(.+)',
+)]
+
+# All intent patterns in priority order. Combined regexes wrap each alternative in a
+# named group p<index> preceded by a lazy prefix, so matching at the start tries the
+# alternatives in order exactly like searching them one at a time.
+_INTENT_PATTERNS = (
+    [('compare', p) for p in _COMPARE_PATTERNS]
+    + [('recall', p) for p in _RECALL_PATTERNS]
+    + [('safety', p) for p in _SAFETY_PATTERNS]
+)
+
+
+def _combine(intents) -> Tuple[tuple, re.Pattern]:
+    """Select the patterns of the given intents and combine them into one regex for .match()"""
+    patterns = tuple(pair for pair in _INTENT_PATTERNS if pair[0] in intents)
+    return patterns, re.compile('|'.join(
+        f'(?s:.*?)(?P<p{index}>{pattern.pattern})'
+        for index, (_, pattern) in enumerate(patterns)
+    ))
+
+
+# Substrings at least one of which every pattern of an intent needs in order to match.
+# Intents whose keywords are all absent are skipped without running their regexes.
+_INTENT_KEYWORDS = {
+    'compare': ('compar', 'vs', 'versus'),
+    'recall': ('recall',),
+    'safety': ('safe', 'side effect', 'adverse event', 'what', 'tell me'),
+}
+
+# Combined pattern for every subset of intents, keyed by the intents it covers
+_COMBINED_PATTERNS = {
+    frozenset(intents): _combine(intents)
+    for size in range(1, len(_INTENT_KEYWORDS) + 1)
+    for intents in itertools.combinations(_INTENT_KEYWORDS, size)
+}
+
+# Filler words dropped from drug name text, and the separators between drug names
+_FILLERS = re.compile(r'\b(?:the|a|an|drug|medication|medicine)\b')
+_SEPARATORS = re.compile(r'[,;]|\s+and\s+|\s+vs\.?\s+|\s+versus\s+')
+_SEPARATOR_SENTINELS = (',', ';', 'and', 'vs', 'versus')
+
+
+def _captured_text(match: re.Match, offset: int, count: int) -> str:
+    """Join a pattern's capture groups, which start after group number offset"""
+    return ", ".join(match.group(offset + i) for i in range(1, count + 1))
+
+
+def _classify_fast(query_lower: str) -> frozenset:
+    """Return the intents whose patterns could match, using plain substring checks"""
+    return frozenset(
+        intent for intent, keywords in _INTENT_KEYWORDS.items()
+        if any(keyword in query_lower for keyword in keywords)
+    )
+
+
+def _intent_matches(query_lower: str):
+    """Yield (intent, captured drug text) for each matching pattern in priority order"""
+    intents = _classify_fast(query_lower)
+    if not intents:
+        return
+    
+    patterns, combined = _COMBINED_PATTERNS[intents]
+    match = combined.match(query_lower)
+    if not match:
+        return
+    
+    index = int(match.lastgroup[1:])
+    intent, pattern = patterns[index]
+    yield intent, _captured_text(match, combined.groupindex[match.lastgroup], pattern.groups)
+    
+    # Later patterns only run if the caller rejects the first match
+    for intent, pattern in patterns[index + 1:]:
+        match = pattern.search(query_lower)
+        if match:
+            yield intent, _captured_text(match, 0, pattern.groups)
+
 
 class QueryParser:
     """Parse natural language queries about drug safety"""
@@ -23,66 +126,28 @@ class QueryParser:
             intent: 'safety', 'recall', 'compare', or 'unknown'
             drug_names: List of extracted drug names
         """
-        query_lower = query.lower().strip()
-        
-        # Pattern 1: Compare queries
-        compare_patterns = [
-            r'compare\s+(.+)',
-            r'comparison\s+(?:of\s+)?(.+)',
-            r'(.+)\s+vs\s+(.+)',
-            r'(.+)\s+versus\s+(.+)',
-        ]
-        
-        for pattern in compare_patterns:
-            match = re.search(pattern, query_lower)
-            if match:
-                # Extract drug names from comma/and separated list
-                text = match.group(1) if match.lastindex == 1 else f"{match.group(1)}, {match.group(2)}"
-                drugs = QueryParser._extract_drug_names(text)
-                if len(drugs) >= 2:
-                    return 'compare', drugs
-        
-        # Pattern 2: Recall queries
-        recall_patterns = [
-            r'(?:any\s+)?recalls?\s+(?:for|on|about)\s+(.+)',
-            r'(?:check|find)\s+recalls?\s+(?:for|on)?\s*(.+)',
-            r'is\s+(.+)\s+recalled',
-            r'has\s+(.+)\s+been\s+recalled',
-        ]
-        
-        for pattern in recall_patterns:
-            match = re.search(pattern, query_lower)
-            if match:
-                drugs = QueryParser._extract_drug_names(match.group(1))
-                if drugs:
-                    return 'recall', drugs
-        
-        # Pattern 3: Safety queries (most common)
-        safety_patterns = [
-            r'(?:tell me about|what about|info on|information on)\s+(.+?)(?:\'s)?\s+safety',
-            r'(?:is|how)\s+safe\s+(?:is\s+)?(.+)',
-            r'safety\s+(?:of|profile|info|information)\s+(?:for|on|about)?\s*(.+)',
-            r'(?:side effects?|adverse events?)\s+(?:of|for)\s+(.+)',
-            r'(.+)\s+(?:side effects?|adverse events?|safety)',
-            r'(?:what|tell me)\s+(?:about|is)\s+(.+)',
-        ]
-        
-        for pattern in safety_patterns:
-            match = re.search(pattern, query_lower)
-            if match:
-                drugs = QueryParser._extract_drug_names(match.group(1))
-                if drugs:
-                    return 'safety', drugs
+        intent, drugs = QueryParser._parse_normalized(query.lower().strip())
+        return intent, list(drugs)
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _parse_normalized(query_lower: str) -> Tuple[str, Tuple[str, ...]]:
+        """Parse a lowercased, stripped query; memoized since queries often repeat"""
+        # Compare, recall, then safety patterns (compare needs at least 2 drugs)
+        for intent, text in _intent_matches(query_lower):
+            drugs = QueryParser._extract_drug_names(text)
+            if len(drugs) >= (2 if intent == 'compare' else 1):
+                return intent, tuple(drugs)
         
         # Fallback: Try to extract any drug name and assume safety query
-        drugs = QueryParser._extract_drug_names(query)
+        drugs = QueryParser._extract_drug_names(query_lower)
         if drugs:
             if len(drugs) >= 2:
-                return 'compare', drugs
+                return 'compare', tuple(drugs)
             else:
-                return 'safety', drugs
+                return 'safety', tuple(drugs)
         
-        return 'unknown', []
+        return 'unknown', ()
     
     @staticmethod
     def _extract_drug_names(text: str) -> List[str]:
@@ -94,23 +159,16 @@ class QueryParser:
         text = text.lower().strip()
         
         # Remove common filler words
-        for word in ['the', 'a', 'an', 'drug', 'medication', 'medicine']:
-            text = re.sub(rf'\b{word}\b', '', text)
-        
-        # Split by common separators
-        separators = r'[,;]|\s+and\s+|\s+vs\.?\s+|\s+versus\s+'
-        parts = re.split(separators, text)
+        text = _FILLERS.sub('', text)
         
-        # Clean and capitalize each drug name
-        drugs = []
-        for part in parts:
-            part = part.strip()
-            if part and len(part) > 2:  # Avoid very short strings
-                # Capitalize first letter of each word
-                drug_name = ' '.join(word.capitalize() for word in part.split())
-                drugs.append(drug_name)
+        # Split by common separators, skipping the regex when no separator can be present
+        if any(sentinel in text for sentinel in _SEPARATOR_SENTINELS):
+            parts = _SEPARATORS.split(text)
+        else:
+            parts = [text]
         
-        return drugs
+        # Capitalize first letter of each word, skipping very short strings
+        return [string.capwords(part) for part in map(str.strip, parts) if len(part) > 2]
     
     @staticmethod
     def get_example_queries() -> List[str]:
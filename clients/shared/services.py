@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+"""
+Shared service construction for drug safety clients
+"""
+
+import os
+import functools
+from collections import namedtuple
+
+from src.fda_service import FDAService
+from src.cache_service import CacheService
+from src.reference_data import ReferenceDataLoader
+from src.ai_service import AIService
+
+Services = namedtuple("Services", ["reference_data", "cache_service", "fda_service", "ai_service"])
+
+
+@functools.lru_cache(maxsize=1)
+def get_services() -> Services:
+    """Create the client services once per process"""
+    reference_data = ReferenceDataLoader("data/drugs_reference.json")
+    cache_service = CacheService("data/cache.db", ttl_hours=24)
+    fda_service = FDAService(rate_limit_per_minute=60)
+    openai_key = os.getenv("OPENAI_API_KEY")
+    ai_service = AIService(openai_key, cache_service) if openai_key else None
+    return Services(reference_data, cache_service, fda_service, ai_service)
@@ -13,4 +13,5 @@ sys.path.insert(0, str(project_root))
 from clients.gradio_client import demo
 
 if __name__ == "__main__":
+    demo.queue(default_concurrency_limit=8)
     demo.launch(share=False, show_error=True)
@@ -1,56 +1,97 @@
 from openai import OpenAI
+from collections import Counter
+from itertools import islice
+from string import Template
+from typing import Optional
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Prompts, parsed once per process
+_SUMMARY_SYSTEM_PROMPT = "You are a medical safety expert who provides clear, factual drug safety summaries."
+_SUMMARY_PROMPT = Template("""
+Analyze the following drug safety data for $drug_name and provide a brief, clear 2-3 sentence safety summary:
+
+Total Adverse Events Reported: $total_events
+Top Side Effects: $top_effects
+
+Provide a concise, patient-friendly summary that highlights the main safety concerns and who should be careful. 
+Be factual and avoid overstating risks. Format: Start with the drug name and main concerns.
+            """)
+
+_COMPARISON_SYSTEM_PROMPT = "You are a medical expert who provides practical drug safety comparisons."
+_COMPARISON_PROMPT = Template("""
+Compare the following drugs and provide a brief recommendation (2-3 sentences) on which is safest and for whom:
+
+$drugs_summary
+
+Be practical and mention specific use cases or patient populations.
+            """)
+
 
 class AIService:
     """Service for OpenAI integration"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, cache_service=None):
         self.client = OpenAI(api_key=api_key)
+        # Optional CacheService for generated text; prompts are deterministic given cached FDA data
+        self.cache_service = cache_service
+    
+    def _cache_key(self, kind: str, *parts) -> str:
+        """Build a cache key from the prompt inputs"""
+        digest = hashlib.blake2b("|".join(str(p) for p in parts).encode(), digest_size=16).hexdigest()
+        return f"{kind}:{digest}"
+    
+    def _get_cached(self, key: str) -> Optional[str]:
+        """Get previously generated text"""
+        if not self.cache_service:
+            return None
+        cached = self.cache_service.get(key)
+        return cached.get("text") if cached else None
+    
+    def _set_cached(self, key: str, text: str) -> None:
+        """Store generated text"""
+        if self.cache_service:
+            self.cache_service.set(key, {"text": text})
     
     def generate_safety_summary(self, drug_name: str, adverse_events_data: dict) -> str:
         """Generate intelligent summary of drug safety using OpenAI"""
         try:
             # Prepare context from adverse events data
             total_events = adverse_events_data.get("total_count", 0)
-            events = adverse_events_data.get("adverse_events", [])
+            events = adverse_events_data.get("adverse_events") or ()
             
-            # Extract top side effects
-            side_effects = {}
-            for event in events[:20]:  # Sample top 20
-                outcomes = event.get("patient", {}).get("reaction", [])
-                for outcome in outcomes:
-                    reaction = outcome.get("reactionmeddrapt", "Unknown")
-                    side_effects[reaction] = side_effects.get(reaction, 0) + 1
+            # Extract top side effects from a sample of the top 20 events
+            side_effects = Counter(
+                outcome.get("reactionmeddrapt", "Unknown")
+                for event in islice(events, 20)
+                for outcome in event.get("patient", {}).get("reaction", ()) or ()
+            )
+            top_effects_str = ", ".join(effect for effect, _ in side_effects.most_common(5))
             
-            top_effects = sorted(side_effects.items(), key=lambda x: x[1], reverse=True)[:5]
-            top_effects_str = ", ".join([effect[0] for effect in top_effects])
+            cache_key = self._cache_key("summary", drug_name, total_events, top_effects_str)
+            cached = self._get_cached(cache_key)
+            if cached:
+                return cached
             
             # Generate summary using GPT
-            prompt = f"""
-Analyze the following drug safety data for {drug_name} and provide a brief, clear 2-3 sentence safety summary:
-
-Total Adverse Events Reported: {total_events}
-Top Side Effects: {top_effects_str}
-
-Provide a concise, patient-friendly summary that highlights the main safety concerns and who should be careful. 
-Be factual and avoid overstating risks. Format: Start with the drug name and main concerns.
-            """
+            prompt = _SUMMARY_PROMPT.substitute(drug_name=drug_name, total_events=total_events, top_effects=top_effects_str)
             
             response = self.client.chat.completions.create(
                 model="gpt-5-nano",
                 messages=[
-                    {"role": "system", "content": "You are a medical safety expert who provides clear, factual drug safety summaries."},
+                    {"role": "system", "content": _SUMMARY_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
                 max_completion_tokens=150
             )
             
-            return response.choices[0].message.content.strip()
+            summary = response.choices[0].message.content.strip()
+            self._set_cached(cache_key, summary)
+            return summary
         except Exception as e:
-            logger.error(f"Error generating summary: {e}")
+            logger.error("Error generating summary: %s", e)
             return f"Safety data available for {drug_name}. {total_events} adverse events reported."
     
     def generate_comparison_recommendation(self, drugs_data: list) -> str:
@@ -61,24 +102,25 @@ Be factual and avoid overstating risks. Format: Start with the drug name and mai
                 for drug in drugs_data
             ])
             
-            prompt = f"""
-Compare the following drugs and provide a brief recommendation (2-3 sentences) on which is safest and for whom:
-
-{drugs_summary}
-
-Be practical and mention specific use cases or patient populations.
-            """
+            cache_key = self._cache_key("comparison", drugs_summary)
+            cached = self._get_cached(cache_key)
+            if cached:
+                return cached
+            
+            prompt = _COMPARISON_PROMPT.substitute(drugs_summary=drugs_summary)
             
             response = self.client.chat.completions.create(
                 model="gpt-5-nano",
                 messages=[
-                    {"role": "system", "content": "You are a medical expert who provides practical drug safety comparisons."},
+                    {"role": "system", "content": _COMPARISON_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
                 max_completion_tokens=200
             )
             
-            return response.choices[0].message.content.strip()
+            recommendation = response.choices[0].message.content.strip()
+            self._set_cached(cache_key, recommendation)
+            return recommendation
         except Exception as e:
-            logger.error(f"Error generating recommendation: {e}")
+            logger.error("Error generating recommendation: %s", e)
             return "Refer to medical professional for personalized recommendation."
@@ -1,16 +1,40 @@
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 import json
-from typing import Optional, Any
+from typing import Optional, Any, Dict, List
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps(data: dict):
+    """Serialize cache data, as bytes when orjson is available"""
+    return orjson.dumps(data) if orjson else json.dumps(data)
+
+
+def _loads(raw) -> dict:
+    """Deserialize cache data stored as bytes or text"""
+    return orjson.loads(raw) if orjson else json.loads(raw)
 
 
 class CacheService:
     """SQLite-based caching service for FDA data"""
     
+    MEMORY_CACHE_SIZE = 256
+    
     def __init__(self, db_path: str = "data/cache.db", ttl_hours: int = 24):
         self.db_path = db_path
         self.ttl_hours = ttl_hours
+        self.ttl_seconds = ttl_hours * 3600
+        self._lock = threading.Lock()
+        # In-memory LRU of decoded entries in front of SQLite:
+        # drug_name -> (expires_at, write timestamp, data)
+        self._mem = OrderedDict()
         self._init_db()
     
     def _init_db(self):
@@ -18,79 +42,168 @@ class CacheService:
         # Create data directory if it doesn't exist
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS cache (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    drug_name TEXT UNIQUE NOT NULL,
-                    data TEXT NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            conn.commit()
+        # One connection for the service lifetime, in autocommit mode and shared across
+        # threads; self._lock serializes access to it
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        # WAL is persistent, so readers and writers from other processes stop blocking each other
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute("PRAGMA cache_size=-64000")
+        self._conn.execute("PRAGMA mmap_size=268435456")
+        
+        # Entries are only a cache, so a table from an older schema (rowid/ISO timestamps,
+        # or no expiry column) is dropped
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(cache)")]
+        if columns and "expires_at" not in columns:
+            self._conn.execute("DROP TABLE cache")
+        
+        # Keyed directly by drug_name (no rowid indirection), times in unix epoch seconds
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                drug_name TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                timestamp REAL NOT NULL DEFAULT ((julianday('now') - 2440587.5) * 86400.0),
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        # Lets purge_expired delete expired entries without scanning the whole table
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_expires_at ON cache(expires_at)")
+    
+    def _remember(self, key: str, data: dict, timestamp: float, expires_at: float) -> None:
+        """Store decoded data written at timestamp in the in-memory tier (caller holds self._lock)"""
+        self._mem[key] = (time.monotonic() + (expires_at - time.time()), timestamp, data)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.MEMORY_CACHE_SIZE:
+            self._mem.popitem(last=False)
     
     def get(self, drug_name: str) -> Optional[dict]:
         """Get cached data for a drug"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT data, timestamp FROM cache WHERE drug_name = ?",
-                (drug_name.lower(),)
-            )
-            row = cursor.fetchone()
+        key = drug_name.lower()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry:
+                expires_at, _, data = entry
+                if time.monotonic() < expires_at:
+                    self._mem.move_to_end(key)
+                    return data
+                del self._mem[key]
+            
+            row = self._conn.execute(
+                "SELECT data, timestamp, expires_at FROM cache WHERE drug_name = ?",
+                (key,)
+            ).fetchone()
             
             if not row:
                 return None
             
-            data_json, timestamp_str = row
-            timestamp = datetime.fromisoformat(timestamp_str)
+            data_json, timestamp, expires_at = row
             
             # Check if cache is still valid
-            if datetime.now() - timestamp > timedelta(hours=self.ttl_hours):
+            if time.time() >= expires_at:
                 # Cache expired, delete it
-                self.delete(drug_name)
+                self._conn.execute("DELETE FROM cache WHERE drug_name = ?", (key,))
                 return None
             
-            return json.loads(data_json)
+            data = _loads(data_json)
+            self._remember(key, data, timestamp, expires_at)
+            return data
     
     def set(self, drug_name: str, data: dict) -> None:
         """Cache data for a drug"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT OR REPLACE INTO cache (drug_name, data) VALUES (?, ?)",
-                (drug_name.lower(), json.dumps(data))
+        key = drug_name.lower()
+        data_json = _dumps(data)
+        timestamp = time.time()
+        expires_at = timestamp + self.ttl_seconds
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (drug_name, data, timestamp, expires_at) VALUES (?, ?, ?, ?)",
+                (key, data_json, timestamp, expires_at)
             )
-            conn.commit()
+            self._remember(key, data, timestamp, expires_at)
     
     def delete(self, drug_name: str) -> None:
         """Delete cached data for a drug"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM cache WHERE drug_name = ?", (drug_name.lower(),))
-            conn.commit()
+        key = drug_name.lower()
+        with self._lock:
+            self._mem.pop(key, None)
+            self._conn.execute("DELETE FROM cache WHERE drug_name = ?", (key,))
     
     def clear(self) -> None:
         """Clear all cache"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM cache")
-            conn.commit()
+        with self._lock:
+            self._mem.clear()
+            self._conn.execute("DELETE FROM cache")
     
-    def get_cache_age(self, drug_name: str) -> Optional[int]:
-        """Get cache age in seconds"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT timestamp FROM cache WHERE drug_name = ?",
-                (drug_name.lower(),)
-            )
-            row = cursor.fetchone()
+    def purge_expired(self) -> int:
+        """Delete expired entries, returning how many were removed"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+            monotonic_now = time.monotonic()
+            for key in [key for key, entry in self._mem.items() if entry[0] <= monotonic_now]:
+                del self._mem[key]
+        return cursor.rowcount
+    
+    def get_many(self, drug_names: List[str]) -> Dict[str, dict]:
+        """Get cached data for several drugs, keyed by lowercased name; misses are omitted"""
+        keys = list(dict.fromkeys(name.lower() for name in drug_names))
+        results = {}
+        with self._lock:
+            now = time.monotonic()
+            misses = []
+            for key in keys:
+                entry = self._mem.get(key)
+                if entry and now < entry[0]:
+                    self._mem.move_to_end(key)
+                    results[key] = entry[2]
+                else:
+                    misses.append(key)
             
-            if not row:
-                return None
+            if not misses:
+                return results
+            
+            # One query for everything the in-memory tier missed
+            placeholders = ", ".join("?" * len(misses))
+            rows = self._conn.execute(
+                f"SELECT drug_name, data, timestamp, expires_at FROM cache WHERE drug_name IN ({placeholders})",
+                misses
+            ).fetchall()
+            
+            expired = []
+            for key, data_json, timestamp, expires_at in rows:
+                if time.time() >= expires_at:
+                    expired.append((key,))
+                    continue
+                data = _loads(data_json)
+                self._remember(key, data, timestamp, expires_at)
+                results[key] = data
             
-            timestamp = datetime.fromisoformat(row[0])
-            age_seconds = int((datetime.now() - timestamp).total_seconds())
-            return age_seconds
+            if expired:
+                self._conn.executemany("DELETE FROM cache WHERE drug_name = ?", expired)
+        
+        return results
+    
+    def get_cache_age(self, drug_name: str) -> Optional[int]:
+        """Get cache age in seconds"""
+        key = drug_name.lower()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry:
+                timestamp = entry[1]
+            else:
+                row = self._conn.execute(
+                    "SELECT timestamp FROM cache WHERE drug_name = ?",
+                    (key,)
+                ).fetchone()
+                if not row:
+                    return None
+                timestamp = row[0]
+        
+        age_seconds = int(time.time() - timestamp)
+        return age_seconds
+    
+    def close(self) -> None:
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
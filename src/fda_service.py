@@ -1,33 +1,94 @@
 import httpx
 import asyncio
+import time
+from collections import deque
 from typing import Optional, List, Dict, Any
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 
+def _parse_json(response: httpx.Response) -> Any:
+    """Parse a JSON response body, with orjson straight from the raw bytes when available"""
+    return orjson.loads(response.content) if orjson else response.json()
+
+
 class FDAService:
     """Service for interacting with FDA API"""
     
     BASE_URL = "https://api.fda.gov/drug"
+    # openFDA allows 240 requests per minute (4 per second) per IP without an API key;
+    # requests are paced at that rate with short bursts allowed
+    MAX_REQUESTS_PER_SECOND = 4
+    REQUEST_BURST = 8
+    MAX_CONCURRENT_REQUESTS = 6
     
     def __init__(self, rate_limit_per_minute: int = 60):
         self.rate_limit_per_minute = rate_limit_per_minute
-        self.client = httpx.AsyncClient(timeout=10.0)
-        self.request_times = []
+        self.client = None
+        self._client_loop = None
+        self.request_times = deque(maxlen=rate_limit_per_minute)
+        self._rate_limit_lock = asyncio.Lock()
+        self._semaphore = None
+        # Token bucket pacing individual HTTP requests, refilled continuously
+        self._tokens = float(self.REQUEST_BURST)
+        self._tokens_updated = time.monotonic()
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get the shared HTTP client, keeping connections to FDA alive across requests"""
+        # Connection pools are bound to an event loop, so a caller on a different loop gets a
+        # fresh client; the clients keep one loop per session so this stays a single pool
+        loop = asyncio.get_running_loop()
+        if self.client is None or self._client_loop is not loop:
+            self.client = httpx.AsyncClient(
+                timeout=10.0,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=20)
+            )
+            self._semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+            self._client_loop = loop
+        return self.client
+    
+    async def _acquire_token(self) -> None:
+        """Wait until the token bucket allows another HTTP request"""
+        while True:
+            now = time.monotonic()
+            self._tokens = min(
+                float(self.REQUEST_BURST),
+                self._tokens + (now - self._tokens_updated) * self.MAX_REQUESTS_PER_SECOND
+            )
+            self._tokens_updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.MAX_REQUESTS_PER_SECOND)
+    
+    async def _get(self, url: str, params: Dict[str, Any]) -> httpx.Response:
+        """GET from openFDA, throttled proactively instead of running into 429 responses"""
+        client = self._get_client()
+        async with self._semaphore:
+            await self._acquire_token()
+            return await client.get(url, params=params)
     
     async def check_rate_limit(self) -> bool:
         """Check if we should rate limit"""
-        now = asyncio.get_event_loop().time()
-        # Keep only requests from last minute
-        self.request_times = [t for t in self.request_times if now - t < 60]
-        
-        if len(self.request_times) >= self.rate_limit_per_minute:
-            logger.warning(f"Rate limit approached: {len(self.request_times)}/{self.rate_limit_per_minute}")
-            return False
-        
-        self.request_times.append(now)
-        return True
+        # Concurrent fetches share this window; the lock keeps check-and-append atomic
+        async with self._rate_limit_lock:
+            now = time.monotonic()
+            # Drop requests older than a minute (oldest first)
+            while self.request_times and now - self.request_times[0] >= 60:
+                self.request_times.popleft()
+            
+            if len(self.request_times) >= self.rate_limit_per_minute:
+                logger.warning("Rate limit approached: %s/%s", len(self.request_times), self.rate_limit_per_minute)
+                return False
+            
+            self.request_times.append(now)
+            return True
     
     async def get_adverse_events(self, drug_name: str) -> Optional[Dict[str, Any]]:
         """Get adverse events for a drug"""
@@ -37,42 +98,72 @@ class FDAService:
         
         try:
             # Try searching by brand name first, then generic name
+            upper = drug_name.upper()
             search_queries = [
-                f'openfda.brand_name:"{drug_name.upper()}"',
-                f'openfda.generic_name:"{drug_name.upper()}"',
-                f'patient.drug.medicinalproduct:"{drug_name.upper()}"'
+                f'openfda.brand_name:"{upper}"',
+                f'openfda.generic_name:"{upper}"',
+                f'patient.drug.medicinalproduct:"{upper}"'
             ]
             
-            url = f"{self.BASE_URL}/event.json"
+            # Fire all searches at once, then take the first hit in priority order
+            tasks = [asyncio.create_task(self._fetch_events(query)) for query in search_queries]
+            failed = False
+            try:
+                for search_query, task in zip(search_queries, tasks):
+                    data = await task
+                    if data is None:
+                        failed = True
+                        continue
+                    if data.get("results"):
+                        logger.info("Successfully fetched adverse events using query: %s", search_query)
+                        return {
+                            "adverse_events": data.get("results", []),
+                            "total_count": data.get("meta", {}).get("results", {}).get("total", 0)
+                        }
+            finally:
+                # Lower-priority searches are no longer needed once a hit is found
+                for task in tasks:
+                    task.cancel()
             
-            for search_query in search_queries:
-                try:
-                    # Create a fresh client for this request
-                    async with httpx.AsyncClient(timeout=10.0) as client:
-                        response = await client.get(url, params={"search": search_query, "limit": 100})
-                        
-                        if response.status_code == 200:
-                            data = response.json()
-                            if data.get("results"):
-                                logger.info(f"Successfully fetched adverse events using query: {search_query}")
-                                return {
-                                    "adverse_events": data.get("results", []),
-                                    "total_count": data.get("meta", {}).get("results", {}).get("total", 0)
-                                }
-                except Exception as e:
-                    logger.debug(f"Query {search_query} failed: {e}")
-                    continue
+            # A failed search (429, timeout, HTTP error) may have hidden a hit, so the drug
+            # is only reported as having no events when every search came back empty
+            if failed:
+                logger.error("Adverse event search failed for %s", drug_name)
+                return None
             
             # If no results found, return empty
-            logger.warning(f"No adverse events found for {drug_name} with any search query")
+            logger.warning("No adverse events found for %s with any search query", drug_name)
             return {
                 "adverse_events": [],
                 "total_count": 0
             }
         except Exception as e:
-            logger.error(f"Error fetching adverse events for {drug_name}: {e}")
+            logger.error("Error fetching adverse events for %s: %s", drug_name, e)
             return None
     
+    async def _fetch_events(self, search_query: str) -> Optional[Dict[str, Any]]:
+        """Run a single adverse event search, returning None on failure and {} for no matches"""
+        try:
+            response = await self._get(
+                f"{self.BASE_URL}/event.json",
+                {"search": search_query, "limit": 100}
+            )
+            if response.status_code == 200:
+                return _parse_json(response)
+            # openFDA answers a search without matches with a 404
+            if response.status_code == 404:
+                return {}
+            logger.debug("Query %s failed with status %s", search_query, response.status_code)
+        except Exception as e:
+            logger.debug("Query %s failed: %s", search_query, e)
+        return None
+    
+    async def get_adverse_events_many(self, drug_names: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Get adverse events for several drugs with concurrent per-drug lookups"""
+        names = list(dict.fromkeys(drug_names))
+        results = await asyncio.gather(*(self.get_adverse_events(name) for name in names))
+        return dict(zip(names, results))
+    
     async def get_recalls(self, drug_name: str) -> Optional[Dict[str, Any]]:
         """Get recalls for a drug"""
         if not await self.check_rate_limit():
@@ -83,18 +174,16 @@ class FDAService:
             search_query = f'openfda.generic_name:"{drug_name.upper()}"'
             url = f"{self.BASE_URL}/enforcement.json"
             
-            # Create a fresh client for this request
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(url, params={"search": search_query, "limit": 100})
-                response.raise_for_status()
-                
-                data = response.json()
-                return {
-                    "recalls": data.get("results", []),
-                    "total_count": data.get("meta", {}).get("results", {}).get("total", 0)
-                }
+            response = await self._get(url, {"search": search_query, "limit": 100})
+            response.raise_for_status()
+            
+            data = _parse_json(response)
+            return {
+                "recalls": data.get("results", []),
+                "total_count": data.get("meta", {}).get("results", {}).get("total", 0)
+            }
         except Exception as e:
-            logger.error(f"Error fetching recalls for {drug_name}: {e}")
+            logger.error("Error fetching recalls for %s: %s", drug_name, e)
             return None
     
     async def get_drug_info(self, drug_name: str) -> Optional[Dict[str, Any]]:
@@ -107,17 +196,17 @@ class FDAService:
             search_query = f'openfda.generic_name:"{drug_name.upper()}"'
             url = f"{self.BASE_URL}/label.json"
             
-            # Create a fresh client for this request
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(url, params={"search": search_query, "limit": 10})
-                response.raise_for_status()
-                
-                data = response.json()
-                return data.get("results", [])
+            response = await self._get(url, {"search": search_query, "limit": 10})
+            response.raise_for_status()
+            
+            data = _parse_json(response)
+            return data.get("results", [])
         except Exception as e:
-            logger.error(f"Error fetching drug info for {drug_name}: {e}")
+            logger.error("Error fetching drug info for %s: %s", drug_name, e)
             return None
     
     async def close(self):
         """Close HTTP client"""
-        await self.client.aclose()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
@@ -9,10 +9,13 @@ import json
 import logging
 import asyncio
 import sys
+from collections import Counter
 from datetime import datetime, timedelta
-from typing import Any
+from itertools import islice
+from typing import Any, Optional
 
 from dotenv import load_dotenv
+from pydantic import BaseModel
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp.types import Tool, TextContent
@@ -24,6 +27,11 @@ from cache_service import CacheService
 from fda_service import FDAService
 from ai_service import AIService
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Load environment variables
 load_dotenv()
 
@@ -38,11 +46,84 @@ fda_service = FDAService(rate_limit_per_minute=60)
 openai_key = os.getenv("OPENAI_API_KEY")
 if not openai_key:
     logger.warning("OPENAI_API_KEY not set. AI summarization will be disabled.")
-ai_service = AIService(openai_key) if openai_key else None
+ai_service = AIService(openai_key, cache_service) if openai_key else None
 
 # Create MCP server
 server = Server("Drug Safety Intelligence")
 
+# SafetyProfile fields stored in the cache; the rest vary per request
+_CACHED_PROFILE_FIELDS = (
+    "safety_score",
+    "summary",
+    "adverse_events_count",
+    "top_side_effects",
+    "high_risk_demographics",
+    "active_recalls",
+)
+
+# Shared read-only stand-in for missing FDA event sections
+_EMPTY = {}
+
+# How often expired cache entries are purged while the server runs
+CACHE_GC_INTERVAL_SECONDS = 600
+
+# Upper bound on a single FDA service call, so one slow endpoint can't stall a comparison
+FDA_TIMEOUT_SECONDS = 8
+
+# In-flight _profile_dict calls, keyed by lowercased drug name, so concurrent
+# requests for the same drug share one FDA/AI fetch
+_inflight: dict[str, asyncio.Task] = {}
+
+
+def _json(result: BaseModel) -> str:
+    """Serialize a tool result as indented JSON, through orjson when available"""
+    if orjson:
+        return orjson.dumps(result.model_dump(), option=orjson.OPT_INDENT_2).decode()
+    return result.model_dump_json(indent=2)
+
+
+async def _fda_call(coro):
+    """Await an FDA service call, treating a timeout like a failed request (None)"""
+    try:
+        return await asyncio.wait_for(coro, FDA_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        logger.warning(f"FDA request timed out after {FDA_TIMEOUT_SECONDS} seconds")
+        return None
+
+
+def _json_fields(fields: dict) -> str:
+    """Serialize fields as the indented lines of a top-level JSON object, without braces"""
+    if orjson:
+        text = orjson.dumps(fields, option=orjson.OPT_INDENT_2).decode()
+    else:
+        text = json.dumps(fields, indent=2, ensure_ascii=False)
+    return text[2:-2]
+
+
+def _cached_freshness(drug_name: str) -> str:
+    """Describe how old a drug's cache entry is"""
+    cache_age = cache_service.get_cache_age(drug_name)
+    hours_old = cache_age // 3600 if cache_age else 0
+    return f"{hours_old} hours old (cached)"
+
+
+def _cached_profile_json(drug_name: str) -> Optional[str]:
+    """
+    Assemble a cached safety profile's JSON from its pre-serialized fields.
+    
+    Only drug_name, data_freshness and cached vary per call, so nothing is parsed or
+    validated. Returns None when the profile has to go through drug_safety_profile.
+    """
+    if not reference_data.is_valid_drug(drug_name):
+        return None
+    cached_data = cache_service.get(drug_name)
+    if not cached_data or "fields_json" not in cached_data:
+        return None
+    
+    head = _json_fields({"drug_name": drug_name})
+    tail = _json_fields({"data_freshness": _cached_freshness(drug_name), "cached": True})
+    return "{\n" + head + ",\n" + cached_data["fields_json"] + ",\n" + tail + "\n}"
+
 
 @server.list_tools()
 async def handle_list_tools():
@@ -99,14 +180,17 @@ async def handle_call_tool(name: str, arguments: dict):
     """Handle tool calls"""
     try:
         if name == "drug_safety_profile":
+            cached_json = _cached_profile_json(arguments["drug_name"])
+            if cached_json:
+                return [TextContent(type="text", text=cached_json)]
             result = await drug_safety_profile(arguments["drug_name"])
-            return [TextContent(type="text", text=result.model_dump_json(indent=2))]
+            return [TextContent(type="text", text=_json(result))]
         elif name == "check_drug_recalls":
             result = await check_drug_recalls(arguments["drug_name"])
-            return [TextContent(type="text", text=result.model_dump_json(indent=2))]
+            return [TextContent(type="text", text=_json(result))]
         elif name == "compare_drug_safety":
             result = await compare_drug_safety(arguments["drugs"])
-            return [TextContent(type="text", text=result.model_dump_json(indent=2))]
+            return [TextContent(type="text", text=_json(result))]
         else:
             return [TextContent(type="text", text=f"Unknown tool: {name}")]
     except Exception as e:
@@ -126,49 +210,87 @@ async def drug_safety_profile(drug_name: str) -> SafetyProfile:
     Returns:
         SafetyProfile with safety score, summary, and detailed data
     """
+    # Fields are validated when fetched, or come from a cache entry written from validated fields.
+    # A caller that joined another's in-flight fetch still gets its own spelling of the name back.
+    profile = await _profile_dict(drug_name)
+    return SafetyProfile.model_construct(**{**profile, "drug_name": drug_name})
+
+
+async def _profile_dict(drug_name: str, fda_name: Optional[str] = None) -> dict:
+    """
+    Get a drug's safety profile fields, sharing one fetch between concurrent callers.
+    
+    Callers that already validated the drug pass its fda_name to skip the reference lookup.
+    """
+    key = drug_name.lower()
+    task = _inflight.get(key)
+    if task is None:
+        # The fetch runs in its own task, so it doesn't belong to whichever caller started it
+        task = asyncio.ensure_future(_fetch_profile_fields(drug_name, fda_name))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    
+    # Shielded so a cancelled caller doesn't cancel the fetch other callers are awaiting
+    return await asyncio.shield(task)
+
+
+def _cached_profile_fields(drug_name: str, cached_data: dict) -> dict:
+    """Build safety profile fields from a cache entry"""
+    # Cached fields were validated when the profile was first built
+    return {
+        "drug_name": drug_name,
+        "safety_score": cached_data.get("safety_score", 75),
+        "summary": cached_data.get("summary", ""),
+        "adverse_events_count": cached_data.get("adverse_events_count", 0),
+        "top_side_effects": cached_data.get("top_side_effects", []),
+        "high_risk_demographics": cached_data.get("high_risk_demographics", []),
+        "active_recalls": cached_data.get("active_recalls", 0),
+        "data_freshness": _cached_freshness(drug_name),
+        "cached": True
+    }
+
+
+async def _fetch_profile_fields(drug_name: str, fda_name: Optional[str] = None) -> dict:
+    """Build safety profile fields from the cache or FDA data (see drug_safety_profile)"""
     try:
-        # Validate drug exists in reference data
-        if not reference_data.is_valid_drug(drug_name):
-            similar = reference_data.search_drugs(drug_name)
-            if similar:
-                raise ValueError(f"Drug '{drug_name}' not found. Did you mean: {', '.join([d.name for d in similar])}?")
-            raise ValueError(f"Drug '{drug_name}' not found in reference database")
+        # Validate drug exists in reference data, unless the caller already did
+        if fda_name is None:
+            is_valid, fda_name, similar = reference_data.resolve(drug_name)
+            if not is_valid:
+                if similar:
+                    raise ValueError(f"Drug '{drug_name}' not found. Did you mean: {', '.join([d.name for d in similar])}?")
+                raise ValueError(f"Drug '{drug_name}' not found in reference database")
         
         # Check cache first
         cached_data = cache_service.get(drug_name)
         if cached_data:
-            cache_age = cache_service.get_cache_age(drug_name)
-            hours_old = cache_age // 3600 if cache_age else 0
-            
-            profile = SafetyProfile(
-                drug_name=drug_name,
-                safety_score=cached_data.get("safety_score", 75),
-                summary=cached_data.get("summary", ""),
-                adverse_events_count=cached_data.get("adverse_events_count", 0),
-                top_side_effects=cached_data.get("top_side_effects", []),
-                high_risk_demographics=cached_data.get("high_risk_demographics", []),
-                active_recalls=cached_data.get("active_recalls", 0),
-                data_freshness=f"{hours_old} hours old (cached)",
-                cached=True
-            )
             logger.info(f"Returning cached profile for {drug_name}")
-            return profile
+            return _cached_profile_fields(drug_name, cached_data)
         
-        # Get FDA generic name
-        fda_name = reference_data.get_fda_generic_name(drug_name)
+        # FDA generic name from the reference lookup above
         if not fda_name:
             raise ValueError(f"FDA generic name not found for {drug_name}")
         
         # Fetch from FDA API
         logger.info(f"Fetching data from FDA API for {drug_name}")
         
-        # Get adverse events and recalls
-        adverse_events = await fda_service.get_adverse_events(fda_name)
-        recalls = await fda_service.get_recalls(fda_name)
+        # Get adverse events and recalls concurrently
+        recalls_task = asyncio.create_task(_fda_call(fda_service.get_recalls(fda_name)))
+        adverse_events = await _fda_call(fda_service.get_adverse_events(fda_name))
         
         if not adverse_events:
+            recalls_task.cancel()
             raise ValueError(f"Could not fetch data from FDA API for {drug_name}")
         
+        # Start the AI summary now so it overlaps with the recalls fetch and aggregation below
+        summary_task = None
+        if ai_service:
+            summary_task = asyncio.create_task(
+                asyncio.to_thread(ai_service.generate_safety_summary, drug_name, adverse_events)
+            )
+        
+        recalls = await recalls_task
+        
         # Extract data
         events_count = adverse_events.get("total_count", 0)
         recall_count = recalls.get("total_count", 0) if recalls else 0
@@ -176,54 +298,44 @@ async def drug_safety_profile(drug_name: str) -> SafetyProfile:
         # Generate safety score (simple heuristic)
         safety_score = max(0, min(100, 100 - (events_count / 1000)))
         
-        # Generate summary with AI if available
-        summary = ""
-        if ai_service:
-            summary = ai_service.generate_safety_summary(drug_name, adverse_events)
-        else:
-            summary = f"{drug_name} has {events_count} reported adverse events. Consult healthcare provider for personalized advice."
-        
         # Extract side effects from adverse events
         top_side_effects = []
         high_risk_demographics = []
         
         if adverse_events.get("adverse_events"):
-            side_effects = {}
-            ages = {}
-            for event in adverse_events["adverse_events"][:50]:
+            side_effects = Counter()
+            age_groups = set()
+            for event in islice(adverse_events["adverse_events"], 50):
+                patient = event.get("patient") or _EMPTY
+                
                 # Extract reactions
-                reactions = event.get("patient", {}).get("reaction", [])
-                for reaction in reactions:
-                    effect = reaction.get("reactionmeddrapt", "Unknown")
-                    side_effects[effect] = side_effects.get(effect, 0) + 1
+                reactions = patient.get("reaction") or ()
+                side_effects.update(reaction.get("reactionmeddrapt", "Unknown") for reaction in reactions)
                 
-                # Extract age
-                age = event.get("patient", {}).get("patientonsetage")
-                if age:
+                # Extract age; only which groups occur matters, so stop once both are seen
+                age = patient.get("patientonsetage")
+                if age and len(age_groups) < 2:
                     try:
-                        age_int = int(float(age))
-                        if age_int > 65:
-                            ages["65+"] = ages.get("65+", 0) + 1
-                        elif age_int > 40:
-                            ages["40-65"] = ages.get("40-65", 0) + 1
-                    except:
-                        pass
+                        age_years = float(age)
+                    except (TypeError, ValueError):
+                        continue
+                    # Compared on the float directly: int(age) > 65 is age >= 66, int(age) > 40 is age >= 41
+                    if age_years >= 66:
+                        age_groups.add("65+")
+                    elif age_years >= 41:
+                        age_groups.add("40-65")
             
-            top_side_effects = [effect[0] for effect in sorted(side_effects.items(), key=lambda x: x[1], reverse=True)[:5]]
-            if ages:
-                high_risk_demographics = [f"Elderly ({age})" if age == "65+" else f"Middle-aged ({age})" for age in sorted(ages.keys())]
+            top_side_effects = [effect for effect, _ in side_effects.most_common(5)]
+            if age_groups:
+                high_risk_demographics = [f"Elderly ({age})" if age == "65+" else f"Middle-aged ({age})" for age in sorted(age_groups)]
         
-        # Cache the data
-        cache_data = {
-            "safety_score": safety_score,
-            "summary": summary,
-            "adverse_events_count": events_count,
-            "top_side_effects": top_side_effects,
-            "high_risk_demographics": high_risk_demographics,
-            "active_recalls": recall_count
-        }
-        cache_service.set(drug_name, cache_data)
+        # Generate summary with AI if available
+        if summary_task:
+            summary = await summary_task
+        else:
+            summary = f"{drug_name} has {events_count} reported adverse events. Consult healthcare provider for personalized advice."
         
+        # Validated once here; cache hits and callers reuse the resulting fields
         profile = SafetyProfile(
             drug_name=drug_name,
             safety_score=safety_score,
@@ -234,7 +346,13 @@ async def drug_safety_profile(drug_name: str) -> SafetyProfile:
             active_recalls=recall_count,
             data_freshness="Just fetched from FDA",
             cached=False
-        )
+        ).model_dump()
+        
+        # Cache the validated fields, plus them pre-serialized for _cached_profile_json
+        cache_data = {key: profile[key] for key in _CACHED_PROFILE_FIELDS}
+        cache_data["fields_json"] = _json_fields(dict(cache_data))
+        # Written off the event loop, and shielded so a cancelled request can't interrupt it
+        await asyncio.shield(asyncio.to_thread(cache_service.set, drug_name, cache_data))
         
         logger.info(f"Successfully generated profile for {drug_name}")
         return profile
@@ -256,13 +374,14 @@ async def check_drug_recalls(drug_name: str) -> RecallInfo:
     """
     try:
         # Validate drug
-        if not reference_data.is_valid_drug(drug_name):
+        drug = reference_data.get_drug(drug_name)
+        if not drug:
             raise ValueError(f"Drug '{drug_name}' not found in reference database")
         
-        fda_name = reference_data.get_fda_generic_name(drug_name)
+        fda_name = drug.fda_generic_name
         
         # Fetch recalls
-        recalls = await fda_service.get_recalls(fda_name)
+        recalls = await _fda_call(fda_service.get_recalls(fda_name))
         
         if not recalls:
             return RecallInfo(
@@ -285,6 +404,15 @@ async def check_drug_recalls(drug_name: str) -> RecallInfo:
         raise
 
 
+def _concern(profile: dict) -> str:
+    """Determine a drug's top concern from its profile fields (simplified)"""
+    if profile["high_risk_demographics"]:
+        return f"Risky for {profile['high_risk_demographics'][0]}"
+    if profile["top_side_effects"]:
+        return f"Watch for {profile['top_side_effects'][0]}"
+    return "Monitor for side effects"
+
+
 async def compare_drug_safety(drugs: list) -> DrugComparison:
     """
     Compare safety profiles of multiple drugs.
@@ -302,23 +430,42 @@ async def compare_drug_safety(drugs: list) -> DrugComparison:
         if len(drugs) > 3:
             raise ValueError("Maximum 3 drugs can be compared at once")
         
-        # Get profiles for all drugs
-        comparison_items = []
+        # Validate every drug up front so all unknown names are reported together
+        reference_drugs = [reference_data.get_drug(drug_name) for drug_name in drugs]
+        missing = [drug_name for drug_name, drug in zip(drugs, reference_drugs) if drug is None]
+        if missing:
+            raise ValueError(f"Drugs not found in reference database: {', '.join(missing)}")
+        
+        # One cache query for all drugs; no SafetyProfile is needed here
+        cached = cache_service.get_many(drugs)
+        
+        # Fetch the cache misses concurrently
+        fetches = {
+            drug_name: _profile_dict(drug_name, drug.fda_generic_name)
+            for drug_name, drug in zip(drugs, reference_drugs)
+            if drug_name.lower() not in cached
+        }
+        fetched = dict(zip(fetches, await asyncio.gather(*fetches.values(), return_exceptions=True)))
+        
+        profiles = []
         for drug_name in drugs:
-            profile = await drug_safety_profile(drug_name)
-            
-            # Determine top concern (simplified)
-            concern = "Monitor for side effects"
-            if profile.top_side_effects:
-                concern = f"Watch for {profile.top_side_effects[0]}"
-            if profile.high_risk_demographics:
-                concern = f"Risky for {profile.high_risk_demographics[0]}"
-            
-            comparison_items.append(DrugComparisonItem(
+            if drug_name in fetched:
+                profile = fetched[drug_name]
+                if isinstance(profile, BaseException):
+                    raise profile
+            else:
+                profile = _cached_profile_fields(drug_name, cached[drug_name.lower()])
+            profiles.append(profile)
+        
+        # Profile fields are already validated, so the items are built without revalidation
+        comparison_items = [
+            DrugComparisonItem.model_construct(
                 drug_name=drug_name,
-                safety_score=profile.safety_score,
-                top_concern=concern
-            ))
+                safety_score=profile["safety_score"],
+                top_concern=_concern(profile)
+            )
+            for drug_name, profile in zip(drugs, profiles)
+        ]
         
         # Generate recommendation with AI if available
         recommendation = ""
@@ -331,7 +478,7 @@ async def compare_drug_safety(drugs: list) -> DrugComparison:
                 }
                 for item in comparison_items
             ]
-            recommendation = ai_service.generate_comparison_recommendation(drugs_data)
+            recommendation = await asyncio.to_thread(ai_service.generate_comparison_recommendation, drugs_data)
         else:
             # Fallback recommendation
             safest = max(comparison_items, key=lambda x: x.safety_score)
@@ -347,17 +494,32 @@ async def compare_drug_safety(drugs: list) -> DrugComparison:
         raise
 
 
+async def _cache_gc_loop():
+    """Periodically delete expired cache entries so the cache table doesn't grow unbounded"""
+    while True:
+        try:
+            removed = await asyncio.to_thread(cache_service.purge_expired)
+            if removed:
+                logger.info(f"Purged {removed} expired cache entries")
+        except Exception as e:
+            logger.error(f"Error purging expired cache entries: {e}")
+        await asyncio.sleep(CACHE_GC_INTERVAL_SECONDS)
+
+
 async def main():
     """Run the MCP server"""
     logger.info("Starting Drug Safety Intelligence MCP Server")
     logger.info(f"Reference drugs loaded: {len(reference_data.drugs)}")
     logger.info("Available tools: drug_safety_profile, check_drug_recalls, compare_drug_safety")
     
-    # Use stdio transport for MCP server
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(read_stream, write_stream, None)
+    gc_task = asyncio.create_task(_cache_gc_loop())
+    try:
+        # Use stdio transport for MCP server
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(read_stream, write_stream, None)
+    finally:
+        gc_task.cancel()
 
 
 if __name__ == "__main__":
-    import sys
     asyncio.run(main())
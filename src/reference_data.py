@@ -1,13 +1,33 @@
 import json
 import os
+import bisect
+import functools
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from pydantic import TypeAdapter
 from models import Drug
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_DRUG_LIST = TypeAdapter(List[Drug])
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_drugs(path: str, mtime: float) -> tuple:
+    """Parse and validate a reference file; memoized until the file's mtime changes"""
+    raw = Path(path).read_bytes()
+    data = orjson.loads(raw) if orjson else json.loads(raw)
+    return tuple(_DRUG_LIST.validate_python(data.get('drugs', [])))
+
 
 class ReferenceDataLoader:
     """Loads and manages reference drug data"""
     
+    __slots__ = ("data_path", "drugs", "drug_map", "_name_pairs", "_names_only", "_names_lower")
+    
     def __init__(self, data_path: str = "data/drugs_reference.json"):
         self.data_path = data_path
         self.drugs: List[Drug] = []
@@ -17,30 +37,65 @@ class ReferenceDataLoader:
     def _load(self):
         """Load drugs from JSON file"""
         try:
-            with open(self.data_path, 'r') as f:
-                data = json.load(f)
-                self.drugs = [Drug(**drug) for drug in data.get('drugs', [])]
-                # Create case-insensitive lookup map
-                for drug in self.drugs:
-                    self.drug_map[drug.name.lower()] = drug
-                    self.drug_map[drug.fda_generic_name.lower()] = drug
+            self.drugs = list(_parse_drugs(self.data_path, os.stat(self.data_path).st_mtime))
         except FileNotFoundError:
             print(f"Warning: Reference data file not found at {self.data_path}")
             self.drugs = []
+        
+        # Lowercased (name, generic name) per drug, in self.drugs order
+        self._names_lower = tuple((drug.name.lower(), drug.fda_generic_name.lower()) for drug in self.drugs)
+        
+        # Create case-insensitive lookup map
+        self.drug_map = {
+            key: drug
+            for drug, names in zip(self.drugs, self._names_lower)
+            for key in names
+        }
+        
+        # Sorted lowercased names and generic names, for bisect-based prefix search
+        self._name_pairs = sorted(
+            [(name, drug) for drug, (name, _) in zip(self.drugs, self._names_lower)] +
+            [(generic, drug) for drug, (_, generic) in zip(self.drugs, self._names_lower)],
+            key=lambda pair: pair[0]
+        )
+        self._names_only = [pair[0] for pair in self._name_pairs]
     
     def get_drug(self, drug_name: str) -> Optional[Drug]:
         """Get drug by name (case-insensitive)"""
         return self.drug_map.get(drug_name.lower())
     
     def search_drugs(self, query: str) -> List[Drug]:
-        """Search drugs by name or generic name"""
+        """Search drugs by name or generic name, preferring prefix matches"""
         query_lower = query.lower()
+        
+        matches = {}
+        index = bisect.bisect_left(self._names_only, query_lower)
+        while index < len(self._names_only) and self._names_only[index].startswith(query_lower):
+            drug = self._name_pairs[index][1]
+            matches.setdefault(drug.id, drug)
+            index += 1
+        if matches:
+            return list(matches.values())
+        
+        # No name starts with the query, so fall back to a substring scan
         return [
-            drug for drug in self.drugs
-            if query_lower in drug.name.lower() or 
-               query_lower in drug.fda_generic_name.lower()
+            drug for drug, (name, generic) in zip(self.drugs, self._names_lower)
+            if query_lower in name or query_lower in generic
         ]
     
+    def resolve(self, drug_name: str) -> Tuple[bool, Optional[str], List[Drug]]:
+        """
+        Validate a drug name in one lookup
+        
+        Returns:
+            Tuple of (is_valid, fda_generic_name, similar)
+            similar: Suggested drugs, only searched for when the name is not valid
+        """
+        drug = self.drug_map.get(drug_name.lower())
+        if drug:
+            return True, drug.fda_generic_name, []
+        return False, None, self.search_drugs(drug_name)
+    
     def is_valid_drug(self, drug_name: str) -> bool:
         """Check if drug exists in reference data"""
         return drug_name.lower() in self.drug_map